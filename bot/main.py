@@ -1,13 +1,24 @@
 import os
 import re
-import time
 import html
+import asyncio
 import hashlib
+import logging
+import sqlite3
 from datetime import datetime, timezone
-from urllib.parse import urlparse
+from functools import lru_cache
 
-import requests
+import httpx
 import feedparser
+from lxml import etree
+from lxml import html as lxml_html
+
+try:
+    import ahocorasick  # C extension: tutte le keyword in una passata DFA
+except ImportError:
+    ahocorasick = None
+
+logger = logging.getLogger(__name__)
 
 
 # -------------------- SUPABASE --------------------
@@ -17,6 +28,7 @@ SUPABASE_KEY = os.environ["SUPABASE_SERVICE_ROLE_KEY"]
 
 # NIENTE on_conflict qui: lo aggiungiamo nella request (una sola volta)
 TABLE_URL = f"{SUPABASE_URL}/rest/v1/startups"
+UPSERT_URL = f"{TABLE_URL}?on_conflict=external_id"
 
 HEADERS = {
     "apikey": SUPABASE_KEY,
@@ -36,25 +48,29 @@ FEEDS = [
 # -------------------- 1) FILTRO NOMI “PRO” --------------------
 
 # geografie / macro-parole che NON sono nomi azienda
-GEO = {
+GEO = frozenset({
     "UK","US","EU","UAE","USA","Europe","European","London","Paris","Berlin","Germany","German",
     "France","French","Spain","Spanish","Italy","Italian","China","India","World","Global"
-}
+})
 
 # parole tipiche da titolo che non sono aziende
-NOISE = {
+NOISE = frozenset({
     "AI","This","That","These","Those","Ask","Are","How","Why","What","When","Where","Who",
     "Ex","Breaking","Report","Opinion","Analysis","Startup","Startups","VC","CEO","IPO"
-}
+})
 
 # stopwords in minuscolo
-BAD_LOWER = {
+BAD_LOWER = frozenset({
     "startup","startups","company","companies","firm","fund","funding","raises","raise","raised",
     "round","seed","series","pre-seed","deal","launch","launches","announces","announce","says","said",
     "adds","added","report","interview","podcast","newsletter","today","yesterday","tomorrow"
-}
+})
+
+ORG_SUFFIX = frozenset({"Inc","Ltd","PLC","LLC","GmbH","SAS","Srl","Srls","BV","AB","Oy","SA","AG","NV"})
 
-ORG_SUFFIX = {"Inc","Ltd","PLC","LLC","GmbH","SAS","Srl","Srls","BV","AB","Oy","SA","AG","NV"}
+# blacklist unica per i token capitalizzati (GEO+NOISE in un probe solo);
+# le stopword di BAD_LOWER restano case-insensitive via w.lower()
+BAD_UNION = GEO | NOISE
 
 # Verbi “da news” che spesso seguono il nome azienda
 ACTION_VERBS = (
@@ -62,74 +78,78 @@ ACTION_VERBS = (
     "lands|landed|partners|partnered|backs|backed|files|filed|unveils|unveiled|introduces|introduced"
 )
 
+# pattern compilati UNA volta a import time (hot path: girano su ogni titolo)
+WHITESPACE_RE = re.compile(r"\s+")
+HTML_TAG_RE = re.compile(r"<[^>]+>")
+# pattern forte unificato: Name's... / Name raises... in UNA scansione
+TITLE_RE = re.compile(
+    rf"^(?P<name>[A-Z][A-Za-z0-9&.-]+(?:\s[A-Z][A-Za-z0-9&.-]+){{0,2}})"
+    rf"(?:'s\b|\s+(?:{ACTION_VERBS})\b)"
+)
+CAPITALIZED_SEQ_RE = re.compile(r"\b([A-Z][A-Za-z0-9&.-]+(?:\s[A-Z][A-Za-z0-9&.-]+){0,2})\b")
+AFTER_VERB_RE = re.compile(rf"^({ACTION_VERBS})\b", re.IGNORECASE)
+
 def normalize_spaces(s: str) -> str:
-    return re.sub(r"\s+", " ", (s or "")).strip()
+    return WHITESPACE_RE.sub(" ", (s or "")).strip()
 
 def clean_text(s: str) -> str:
     # decode html entities + strip tags
-    s = html.unescape(s or "")
-    s = re.sub(r"<[^>]+>", " ", s)
-    return normalize_spaces(s)
+    if not s:
+        return ""
+    if "<" not in s:
+        # niente tag: basta decodificare le entity
+        return normalize_spaces(html.unescape(s))
+    try:
+        # lxml fa entity + tag in un'unica passata C; join con spazio per
+        # replicare il vecchio tag->spazio (niente parole incollate su <br>, <p>...)
+        return normalize_spaces(" ".join(lxml_html.fromstring(s).itertext()))
+    except (etree.ParserError, ValueError):
+        # frammento non parsabile (o dichiarazione XML in una str unicode):
+        # vecchia strada unescape + regex
+        return normalize_spaces(HTML_TAG_RE.sub(" ", html.unescape(s)))
 
 def token_ok(w: str) -> bool:
-    if not w:
-        return False
-
-    w = w.strip()
-
-    # scarta robe troppo corte (via X, UK, AI ecc)
-    if len(w) < 3:
-        return False
-
-    # scarta token con numeri
-    if any(ch.isdigit() for ch in w):
-        return False
-
-    # scarta pure acronimi corti all-caps (CEO, IPO)
-    if w.isupper() and len(w) <= 4:
-        return False
-
-    # blacklist
-    if w in GEO or w in NOISE:
-        return False
-    if w.lower() in BAD_LOWER:
-        return False
-
-    return True
+    # scarta: corti (X, UK, AI), token con numeri, acronimi all-caps (CEO, IPO)
+    # e blacklist; niente isalpha() qui — & . - sono validi nei nomi (Coca-Cola, Tiny.io)
+    return (
+        len(w) >= 3
+        and not any(ch.isdigit() for ch in w)
+        and not (w.isupper() and len(w) <= 4)
+        and w not in BAD_UNION
+        and w.lower() not in BAD_LOWER
+    )
 
 def strip_org_suffix(name: str) -> str:
     parts = name.split()
     parts = [p for p in parts if p not in ORG_SUFFIX]
     return " ".join(parts).strip()
 
+@lru_cache(maxsize=4096)
 def extract_company_name(title: str) -> str | None:
     """
     Estrae un nome azienda “realistico”:
-    1) pattern forti in testa (Name's..., Name raises..., Name acquires...)
+    1) pattern forte in testa (Name's..., Name raises..., Name acquires...)
     2) fallback: migliori sequenze Capitalized 1-3 parole con score
-    """
-    t = normalize_spaces((title or "").replace("’", "'"))
 
-    # -------- pattern forti (molto precisi) --------
-    strong_patterns = [
-        rf"^([A-Z][A-Za-z0-9&.-]+(?:\s[A-Z][A-Za-z0-9&.-]+){{0,2}})'s\b",
-        rf"^([A-Z][A-Za-z0-9&.-]+(?:\s[A-Z][A-Za-z0-9&.-]+){{0,2}})\s+({ACTION_VERBS})\b",
-    ]
-
-    for pat in strong_patterns:
-        m = re.search(pat, t)
-        if m:
-            cand = strip_org_suffix(normalize_spaces(m.group(1)))
-            if cand and all(token_ok(p) for p in cand.split()):
-                # evita che sia solo GEO / NOISE come multiword
-                if cand in GEO or cand in NOISE:
-                    return None
-                return cand
+    Il titolo arriva già pulito/normalizzato da clean_text (niente ri-normalize qui).
+    Cached: i titoli RSS si ripetono identici tra run consecutivi dei feed.
+    """
+    t = title or ""
+
+    # -------- pattern forte (molto preciso): una sola scansione --------
+    m = TITLE_RE.match(t)
+    if m:
+        cand = strip_org_suffix(m.group("name"))
+        if cand and all(token_ok(p) for p in cand.split()):
+            # evita che sia solo GEO / NOISE come multiword
+            if cand in GEO or cand in NOISE:
+                return None
+            return cand
 
     # -------- fallback: candidate sequences --------
     # prendi sequenze 1-3 parole che iniziano con maiuscola (includi OpenAI, Midjourney, DeepMind ecc)
-    seqs = re.findall(r"\b([A-Z][A-Za-z0-9&.-]+(?:\s[A-Z][A-Za-z0-9&.-]+){0,2})\b", t)
-    seqs = [strip_org_suffix(normalize_spaces(s)) for s in seqs]
+    # t è già a spazi singoli, quindi strip_org_suffix basta come cleanup
+    seqs = [strip_org_suffix(s) for s in CAPITALIZED_SEQ_RE.findall(t)]
     seqs = [s for s in seqs if s]
 
     if not seqs:
@@ -155,7 +175,7 @@ def extract_company_name(title: str) -> str | None:
 
         # bonus se nel titolo subito dopo compare un verbo “da news”
         after = t[len(s):].lstrip()
-        if re.match(rf"^({ACTION_VERBS})\b", after, re.IGNORECASE):
+        if AFTER_VERB_RE.match(after):
             score += 8
 
         # penalizza se sembra una location/geo
@@ -179,31 +199,30 @@ def extract_company_name(title: str) -> str | None:
 
 # -------------------- 2) ESTRAZIONE DOMINI --------------------
 
-DOMAIN_RE = re.compile(
-    r"\b((?:[a-zA-Z0-9-]+\.)+(?:com|io|ai|co|net|org|app|dev|info|eu|it|fr|de|es|uk|me|xyz))\b",
-    re.IGNORECASE,
-)
+# pattern generico (niente alternation a 16 vie nel motore regex):
+# matcha qualsiasi nome puntato, poi filtriamo i TLD con un probe di set
+DOMAIN_RE = re.compile(r"\b((?:[a-z0-9-]+\.)+[a-z]{2,6})\b", re.IGNORECASE)
+
+VALID_TLDS = frozenset({
+    "com","io","ai","co","net","org","app","dev","info","eu","it","fr","de","es","uk","me","xyz"
+})
+
+# solo l'host: un match regex invece dello state-machine completo di urlparse
+HOST_RE = re.compile(r"^[a-z][a-z0-9+.-]*://(?:www\.)?([^/:?#\s]+)", re.IGNORECASE)
 
 def get_domain_from_url(url: str) -> str | None:
-    try:
-        host = urlparse(url).netloc.lower().split(":")[0]
-        if host.startswith("www."):
-            host = host[4:]
-        return host or None
-    except Exception:
-        return None
+    m = HOST_RE.match(url or "")
+    return m.group(1).lower() if m else None
 
 def extract_domains(text: str) -> list[str]:
     if not text:
         return []
-    found = DOMAIN_RE.findall(text)
-    out = []
-    for d in found:
-        d = d.lower()
-        if d.startswith("www."):
-            d = d[4:]
-        out.append(d)
-    return sorted(set(out))
+    # dict.fromkeys = dedup in ordine di apparizione, senza il sort
+    return list(dict.fromkeys(
+        d.lower().removeprefix("www.")
+        for d in DOMAIN_RE.findall(text)
+        if d.rsplit(".", 1)[1].lower() in VALID_TLDS
+    ))
 
 
 # -------------------- 3) SCORING (semplice ma “serio”) --------------------
@@ -220,16 +239,43 @@ KEYWORDS_NEG = {
     "analysis": -4, "explainer": -6,
 }
 
-def compute_score(title: str, summary: str, domains: list[str]) -> int:
-    text = f"{title} {summary}".lower()
+# un'unica alternation compilata: UNA scansione del testo invece di ~20 substring search
+# (chiavi ordinate per lunghezza: le più lunghe vincono, es. "partnership" vs "partners")
+SCORE_WEIGHTS = {**KEYWORDS_POS, **KEYWORDS_NEG}
+SCORE_RE = re.compile(
+    r"\b(" + "|".join(map(re.escape, sorted(SCORE_WEIGHTS, key=len, reverse=True))) + r")\b"
+)
+
+# automa Aho-Corasick: O(N) sul testo anche se la lista keyword cresce;
+# se pyahocorasick manca si resta sulla alternation regex
+if ahocorasick is not None:
+    SCORE_AC = ahocorasick.Automaton()
+    for _k in SCORE_WEIGHTS:
+        SCORE_AC.add_word(_k, _k)
+    SCORE_AC.make_automaton()
+else:
+    SCORE_AC = None
+
+def find_score_keywords(text: str) -> set[str]:
+    if SCORE_AC is None:
+        return {m.group(1) for m in SCORE_RE.finditer(text)}
+    found = set()
+    for end, k in SCORE_AC.iter(text):
+        start = end - len(k) + 1
+        # replica i \b della regex: niente match dentro altre parole
+        before_ok = start == 0 or not (text[start - 1].isalnum() or text[start - 1] == "_")
+        after_ok = end == len(text) - 1 or not (text[end + 1].isalnum() or text[end + 1] == "_")
+        if before_ok and after_ok:
+            found.add(k)
+    return found
+
+def compute_score(text: str, domains: list[str]) -> int:
+    # text = titolo + summary già lowercased dal chiamante (una sola passata)
     score = 50
 
-    for k, w in KEYWORDS_POS.items():
-        if k in text:
-            score += w
-    for k, w in KEYWORDS_NEG.items():
-        if k in text:
-            score += w
+    # ogni keyword pesa una volta, come i vecchi "if k in text"
+    for k in find_score_keywords(text):
+        score += SCORE_WEIGHTS[k]
 
     # segnale forte: presenza domini in testo/summary
     if domains:
@@ -243,73 +289,164 @@ def compute_score(title: str, summary: str, domains: list[str]) -> int:
 # -------------------- 4) UPSERT ROBUSTO --------------------
 
 def generate_external_id(link: str) -> str:
-    return hashlib.md5((link or "").encode("utf-8")).hexdigest()
-
-def utc_now_iso() -> str:
-    return datetime.now(timezone.utc).replace(microsecond=0).isoformat()
-
-def upsert_startup(row: dict) -> tuple[int, str]:
-    # UNA sola volta: on_conflict=external_id
-    url = f"{TABLE_URL}?on_conflict=external_id"
-    r = requests.post(url, json=row, headers=HEADERS, timeout=20)
-    return r.status_code, r.text
+    # blake2b a 128 bit: più veloce di md5, stessa larghezza hex (32 char)
+    return hashlib.blake2b((link or "").encode("utf-8"), digest_size=16).hexdigest()
 
+# cache locale degli external_id già processati: salta CPU + upsert per i ripetuti
+SEEN_DB = os.path.join(os.path.dirname(__file__), "seen.db")
 
-# -------------------- MAIN --------------------
-
-def process():
-    total = 0
-    kept = 0
-
-    for feed_url in FEEDS:
-        feed = feedparser.parse(feed_url)
+def load_seen_ids() -> set[str]:
+    con = sqlite3.connect(SEEN_DB)
+    try:
+        con.execute("CREATE TABLE IF NOT EXISTS seen (id TEXT PRIMARY KEY)")
+        return {row[0] for row in con.execute("SELECT id FROM seen")}
+    finally:
+        con.close()
 
-        for entry in feed.entries[:15]:
-            title = clean_text(getattr(entry, "title", "") or "")
-            link = getattr(entry, "link", "") or ""
-            summary = clean_text(getattr(entry, "summary", "") or "")
+def save_seen_ids(ids: list[str]) -> None:
+    con = sqlite3.connect(SEEN_DB)
+    try:
+        con.executemany("INSERT OR IGNORE INTO seen VALUES (?)", ((i,) for i in ids))
+        con.commit()
+    finally:
+        con.close()
 
-            total += 1
+def utc_now_iso() -> str:
+    return datetime.now(timezone.utc).replace(microsecond=0).isoformat()
 
-            name = extract_company_name(title)
-            if not name:
-                continue  # rumore
+async def upsert_startups(client: httpx.AsyncClient, rows: list[dict]) -> tuple[int, str]:
+    # PostgREST accetta un array JSON -> un solo POST per batch
+    r = await client.post(UPSERT_URL, json=rows, headers=HEADERS, timeout=30)
+    return r.status_code, r.text
 
-            domains = set()
-            domains.update(extract_domains(title))
-            domains.update(extract_domains(summary))
 
-            host = get_domain_from_url(link)
-            if host:
-                domains.add(host)
+# -------------------- FETCH FEED --------------------
 
-            domains = sorted(d for d in domains if d and "." in d)
+MAX_ENTRIES_PER_FEED = 15
 
-            rank_score = compute_score(title, summary, domains)
+async def fetch_feed_entries(client: httpx.AsyncClient, feed_url: str) -> list[dict]:
+    """
+    Scarica l'XML e ne estrae solo title/link/description dei primi 15 item
+    con lxml (C, molto più veloce del parse+sanitize completo di feedparser).
+    feedparser resta come fallback per feed malformati o Atom.
+    """
+    try:
+        resp = await client.get(feed_url, timeout=20)
+        resp.raise_for_status()
+        root = etree.fromstring(resp.content)
+        entries = []
+        for item in root.iter("item"):
+            entries.append({
+                "title": item.findtext("title") or "",
+                "link": (item.findtext("link") or "").strip(),
+                "summary": item.findtext("description") or "",
+            })
+            if len(entries) >= MAX_ENTRIES_PER_FEED:
+                break
+        if entries:
+            return entries
+    except Exception:
+        pass
 
-            row = {
-                "external_id": generate_external_id(link),
-                "name": name,
-                "raw_title": title[:400],
-                "description": summary[:400],
-                "source_url": link,
-                "source_type": "WebScan",
-                "rank_score": rank_score,
-                "tm_risk": "MED",
-                "dom_risk": "MED",
-                "verification_status": "UNVERIFIED",
-                "confidence": 0,
-                "created_at": utc_now_iso(),
-            }
+    # feedparser è sync e fa I/O: in un thread per non bloccare l'event loop
+    feed = await asyncio.to_thread(feedparser.parse, feed_url)
+    return [
+        {"title": e.get("title", ""), "link": e.get("link", ""), "summary": e.get("summary", "")}
+        for e in feed.entries[:MAX_ENTRIES_PER_FEED]
+    ]
 
-            code, _ = upsert_startup(row)
-            print(code, name, "| score:", rank_score, "| domains:", (domains[:3] if domains else []))
 
-            kept += 1
-            time.sleep(0.2)
+# -------------------- MAIN --------------------
 
-    print("DONE. total_seen:", total, "kept:", kept)
+async def process():
+    total = 0
+    kept = 0
+    batches: list[list[dict]] = []
+    seen = load_seen_ids()
+    new_ids: list[str] = []
+    now_iso = utc_now_iso()  # una volta per run: le righe condividono il created_at
+
+    # un solo client per tutto: HTTP/2 multiplexa fetch e upsert sulla stessa connessione
+    async with httpx.AsyncClient(http2=True, follow_redirects=True) as client:
+        # fetch in parallelo: I/O-bound, la latenza totale diventa max() e non sum()
+        parsed = await asyncio.gather(*(fetch_feed_entries(client, u) for u in FEEDS))
+
+        for entries in parsed:
+            rows: list[dict] = []
+            for entry in entries:
+                link = entry["link"]
+
+                total += 1
+
+                # id calcolato PRIMA di tutto: se già visto saltiamo clean/extract/score
+                ext_id = generate_external_id(link)
+                if ext_id in seen:
+                    continue
+                # marca subito: un link ripetuto nello stesso run non deve produrre
+                # due righe con lo stesso conflict key nel batch (Postgres rifiuta
+                # ON CONFLICT DO UPDATE sulla stessa riga due volte)
+                seen.add(ext_id)
+                new_ids.append(ext_id)
+
+                # ogni trasformazione UNA volta sola per entry (niente ri-clean a valle)
+                title = clean_text(entry["title"]).replace("’", "'")
+                summary = clean_text(entry["summary"])
+
+                name = extract_company_name(title)
+                if not name:
+                    continue  # rumore
+
+                # dedup preservando l'ordine: domini da titolo, poi summary, poi host
+                merged = dict.fromkeys(extract_domains(title))
+                merged.update(dict.fromkeys(extract_domains(summary)))
+
+                host = get_domain_from_url(link)
+                if host:
+                    merged.setdefault(host)
+
+                domains = [d for d in merged if d and "." in d]
+
+                rank_score = compute_score(f"{title} {summary}".lower(), domains)
+
+                row = {
+                    "external_id": ext_id,
+                    "name": name,
+                    "raw_title": title[:400],
+                    "description": summary[:400],
+                    "source_url": link,
+                    "source_type": "WebScan",
+                    "rank_score": rank_score,
+                    "tm_risk": "MED",
+                    "dom_risk": "MED",
+                    "verification_status": "UNVERIFIED",
+                    "confidence": 0,
+                    "created_at": now_iso,
+                }
+
+                rows.append(row)
+                # formatting lazy: niente str/format (e niente lock stdio) se INFO è spento
+                logger.info("%s | score:%d | domains:%s", name, rank_score, domains[:3])
+
+                kept += 1
+
+            if rows:
+                batches.append(rows)
+
+        # un POST per feed, tutti in parallelo sulla stessa connessione HTTP/2
+        ok = True
+        if batches:
+            results = await asyncio.gather(*(upsert_startups(client, b) for b in batches))
+            for (code, _), b in zip(results, batches):
+                logger.info("upsert: %d rows:%d", code, len(b))
+            ok = all(code < 300 for code, _ in results)
+
+    # persisti gli id solo se l'upsert è andato: i falliti si ritentano al giro dopo
+    if ok and new_ids:
+        save_seen_ids(new_ids)
+
+    logger.info("DONE. total_seen:%d kept:%d", total, kept)
 
 
 if __name__ == "__main__":
-    process()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    asyncio.run(process())